@@ -1,8 +1,313 @@
-import tiktoken
-
-encoding = tiktoken.get_encoding("cl100k_base")
-encoding = tiktoken.encoding_for_model("gpt-4")
-with open(r".\resources\prompt.txt","r", encoding="utf8") as f:
-    prompt = f.read()
-    print("token: ",len(encoding.encode(prompt)))
-    print("word: ",len(prompt))
+"""
+cal_token.py
+
+这个脚本用于统计文本文件的 token 数和字符数。可以一次处理多个文件、文件夹（递归处理其中所有文件）或通配符，
+输出每个文件以及总计的 token 数和字符数。
+
+大文件会按块读取，块的边界选在换行符之后、下一个非空白字符之前，保证分块统计的结果与整体统计一致。
+所有块分发到进程池中统计，每个进程只加载一次编码器，吞吐量随 CPU 核心数增长。
+
+也可以以守护进程方式运行：守护进程一直保持编码器加载，通过本地 Unix socket 或标准输入输出的行协议回答统计请求，
+并以内容哈希为键在 LRU 缓存中保存结果，重复的文本可以立即返回。客户端模式会把文件内容发送给守护进程，
+守护进程没有运行时自动退回到本进程内统计。客户端模式不会导入 tiktoken，所以启动很快。
+
+行协议：每行一个 JSON 请求 {"text": "...", "model": "gpt-4", "encoding": null}，
+守护进程返回一行 JSON {"tokens": 0, "chars": 0, "cached": false}，出错时返回 {"error": "..."}。
+
+用法：
+    python cal_token.py [paths ...] [--model gpt-4] [--encoding cl100k_base] [--workers N] [--chunk-size BYTES] [--format table|jsonl]
+    python cal_token.py --serve [--socket PATH | --stdio] [--cache-size N]
+    python cal_token.py --client [paths ...] [--socket PATH]
+
+参数：
+- paths：文件、文件夹或通配符（例如 "prompts/**/*.txt"），默认是 resources/prompt.txt。
+- model：按模型名称选择编码器，默认是 gpt-4。
+- encoding：直接指定编码器名称，指定后忽略 model。
+- workers：进程数，默认等于 CPU 核心数。
+- chunk-size：每块的大约字节数，默认 4 MiB。
+- format：输出格式，table 为表格，jsonl 为每行一个 JSON 对象，最后一行是总计。
+- serve：以守护进程方式运行。默认监听 --socket 指定的 Unix socket，指定 --stdio 时改用标准输入输出。
+- client：通过守护进程统计，守护进程没有运行时退回到本进程内统计。
+- socket：Unix socket 的路径，默认是临时文件夹下的 cal_token.sock。
+- cache-size：守护进程 LRU 缓存的最大条目数，默认 10000。
+"""
+
+import os
+import sys
+import glob
+import json
+import socket
+import hashlib
+import argparse
+import tempfile
+import threading
+import collections
+import socketserver
+from concurrent.futures import ProcessPoolExecutor
+
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024
+DEFAULT_SOCKET_PATH = os.path.join(tempfile.gettempdir(), 'cal_token.sock')
+DEFAULT_CACHE_SIZE = 10000
+
+# 每个工作进程中的编码器，由 init_worker 加载一次
+_encoding = None
+
+
+def load_encoding(model, encoding_name=None):
+    import tiktoken
+    if encoding_name:
+        return tiktoken.get_encoding(encoding_name)
+    return tiktoken.encoding_for_model(model)
+
+
+def init_worker(model, encoding_name):
+    global _encoding
+    _encoding = load_encoding(model, encoding_name)
+
+
+def count_segment(segment):
+    path, start, end = segment
+    with open(path, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode('utf8', errors='replace')
+    # 把特殊 token 的文本当作普通文本统计，而不是抛出异常
+    return len(_encoding.encode(text, disallowed_special=())), len(text)
+
+
+def find_boundary(f, offset, size):
+    """从 offset 开始向后查找第一个"换行符之后紧跟非空白字符"的位置，找不到时返回文件末尾。"""
+    f.seek(offset)
+    previous = b''
+    position = offset
+    while True:
+        block = f.read(64 * 1024)
+        if not block:
+            return size
+        data = previous + block
+        base = position - len(previous)
+        index = data.find(b'\n')
+        while index != -1 and index + 1 < len(data):
+            if not data[index + 1:index + 2].isspace():
+                return base + index + 1
+            index = data.find(b'\n', index + 1)
+        # 换行符恰好在块末尾时，需要和下一块一起判断
+        previous = data[-1:]
+        position += len(block)
+
+
+def split_file(path, chunk_size):
+    # 换行符在 UTF-8 中不会出现在多字节字符内部，按字节切分不会截断字符
+    size = os.path.getsize(path)
+    segments = []
+    start = 0
+    with open(path, 'rb') as f:
+        while start < size:
+            end = size if start + chunk_size >= size else find_boundary(f, start + chunk_size, size)
+            segments.append((path, start, end))
+            start = end
+    # 空文件也输出一行结果
+    return segments or [(path, 0, 0)]
+
+
+def expand_paths(patterns):
+    paths = []
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            matches = sorted(glob.glob(pattern, recursive=True))
+        else:
+            matches = [pattern]
+        for match in matches:
+            if os.path.isdir(match):
+                for root, dirs, files in os.walk(match):
+                    dirs.sort()
+                    paths.extend(os.path.join(root, file) for file in sorted(files))
+            elif os.path.isfile(match):
+                paths.append(match)
+            else:
+                print(f"Skipping {match}: no such file or directory", file=sys.stderr)
+    # 去掉重复的文件，保持原有顺序
+    return list(dict.fromkeys(paths))
+
+
+def count_tokens(paths, model='gpt-4', encoding_name=None, workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """返回 {文件路径: (token 数, 字符数)}，顺序与 paths 一致。"""
+    segments = [segment for path in paths for segment in split_file(path, chunk_size)]
+    results = {path: (0, 0) for path in paths}
+    if not segments:
+        return results
+    # 进程数不超过块数；只有一块时直接在本进程内统计，省去启动进程和重复加载编码器的开销
+    workers = min(workers or os.cpu_count() or 1, len(segments))
+    if workers <= 1:
+        init_worker(model, encoding_name)
+        counts = map(count_segment, segments)
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(model, encoding_name))
+        counts = executor.map(count_segment, segments, chunksize=4)
+    try:
+        for (path, _, _), (tokens, chars) in zip(segments, counts):
+            results[path] = (results[path][0] + tokens, results[path][1] + chars)
+    finally:
+        if workers > 1:
+            executor.shutdown()
+    return results
+
+
+class TokenCounter:
+    """守护进程使用的统计器：编码器只加载一次，结果按 (编码器, 内容哈希) 保存在 LRU 缓存中。"""
+
+    def __init__(self, cache_size=DEFAULT_CACHE_SIZE):
+        self.cache_size = cache_size
+        self.encodings = {}
+        self.cache = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_encoding(self, model, encoding_name):
+        key = encoding_name or model
+        with self.lock:
+            if key not in self.encodings:
+                self.encodings[key] = load_encoding(model, encoding_name)
+            return self.encodings[key]
+
+    def count(self, text, model='gpt-4', encoding_name=None):
+        encoding = self.get_encoding(model, encoding_name)
+        key = (encoding.name, hashlib.sha256(text.encode('utf8')).hexdigest())
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key] + (True,)
+        result = (len(encoding.encode(text, disallowed_special=())), len(text))
+        with self.lock:
+            self.cache[key] = result
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return result + (False,)
+
+    def handle(self, line):
+        try:
+            request = json.loads(line)
+            tokens, chars, cached = self.count(request['text'], request.get('model') or 'gpt-4', request.get('encoding'))
+            response = {'tokens': tokens, 'chars': chars, 'cached': cached}
+        except Exception as e:
+            response = {'error': f"{type(e).__name__}: {e}"}
+        return json.dumps(response) + '\n'
+
+
+def serve_stdio(counter):
+    for line in sys.stdin:
+        if line.strip():
+            sys.stdout.write(counter.handle(line))
+            sys.stdout.flush()
+
+
+def serve_socket(counter, socket_path):
+    if not hasattr(socket, 'AF_UNIX'):
+        sys.exit("Unix sockets are not supported on this platform, use --stdio instead.")
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                if line.strip():
+                    self.wfile.write(counter.handle(line.decode('utf8')).encode('utf8'))
+                    self.wfile.flush()
+
+    # 上一次运行留下的 socket 文件会导致绑定失败；但如果已有守护进程在监听，不能删除它的 socket
+    if os.path.exists(socket_path):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(socket_path)
+            except OSError:
+                os.remove(socket_path)
+            else:
+                sys.exit(f"A daemon is already serving on {socket_path}.")
+    with socketserver.ThreadingUnixStreamServer(socket_path, Handler) as server:
+        print(f"Serving on {socket_path}", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.remove(socket_path)
+
+
+def count_tokens_via_daemon(paths, socket_path, model='gpt-4', encoding_name=None):
+    """通过守护进程统计，返回 {文件路径: (token 数, 字符数)}。守护进程没有运行或中途断开时返回 None。"""
+    if not hasattr(socket, 'AF_UNIX'):
+        return None
+    try:
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        conn.connect(socket_path)
+    except OSError:
+        return None
+
+    results = {}
+    with conn, conn.makefile('rwb') as f:
+        for path in paths:
+            # 与 count_segment 一样按字节读取后解码，保留 \r\n，两种方式的统计结果一致
+            with open(path, 'rb') as binary_file:
+                request = {'text': binary_file.read().decode('utf8', errors='replace'), 'model': model, 'encoding': encoding_name}
+            try:
+                f.write((json.dumps(request) + '\n').encode('utf8'))
+                f.flush()
+                line = f.readline()
+            except OSError:
+                return None
+            if not line:
+                return None
+            response = json.loads(line)
+            if 'error' in response:
+                raise RuntimeError(f"Daemon failed to count {path}: {response['error']}")
+            results[path] = (response['tokens'], response['chars'])
+    return results
+
+
+def print_results(results, output_format):
+    total_tokens = sum(tokens for tokens, _ in results.values())
+    total_chars = sum(chars for _, chars in results.values())
+    if output_format == 'jsonl':
+        for path, (tokens, chars) in results.items():
+            print(json.dumps({'path': path, 'tokens': tokens, 'chars': chars}, ensure_ascii=False))
+        print(json.dumps({'total': {'files': len(results), 'tokens': total_tokens, 'chars': total_chars}}))
+        return
+
+    width = max([len(path) for path in results] + [len('TOTAL')])
+    print(f"{'path':<{width}} {'tokens':>12} {'chars':>12}")
+    for path, (tokens, chars) in results.items():
+        print(f"{path:<{width}} {tokens:>12} {chars:>12}")
+    print(f"{'TOTAL':<{width}} {total_tokens:>12} {total_chars:>12}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Count tokens and characters of text files.')
+    parser.add_argument('paths', nargs='*', default=[os.path.join('resources', 'prompt.txt')],
+                        help='Files, directories or glob patterns.')
+    parser.add_argument('--model', default='gpt-4', help='Model whose encoding is used.')
+    parser.add_argument('--encoding', help='Encoding name, overrides --model.')
+    parser.add_argument('--workers', type=int, help='Number of worker processes. Defaults to the number of CPUs.')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Approximate chunk size in bytes.')
+    parser.add_argument('--format', choices=['table', 'jsonl'], default='table', help='Output format.')
+    parser.add_argument('--serve', action='store_true', help='Run as a daemon that keeps the encoders loaded.')
+    parser.add_argument('--stdio', action='store_true', help='Serve the line protocol on stdin/stdout instead of a socket.')
+    parser.add_argument('--client', action='store_true', help='Count through the daemon, falling back to in-process counting.')
+    parser.add_argument('--socket', default=DEFAULT_SOCKET_PATH, help='Path of the daemon Unix socket.')
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE, help='Maximum number of cached results in the daemon.')
+    args = parser.parse_args()
+
+    if args.serve:
+        counter = TokenCounter(args.cache_size)
+        # 启动时先加载默认的编码器，第一个请求不需要等待
+        counter.get_encoding(args.model, args.encoding)
+        if args.stdio:
+            serve_stdio(counter)
+        else:
+            serve_socket(counter, args.socket)
+        sys.exit(0)
+
+    paths = expand_paths(args.paths)
+    results = None
+    if args.client:
+        results = count_tokens_via_daemon(paths, args.socket, args.model, args.encoding)
+        if results is None:
+            print(f"Daemon is not running on {args.socket}, counting in-process.", file=sys.stderr)
+    if results is None:
+        results = count_tokens(paths, args.model, args.encoding, args.workers, args.chunk_size)
+    print_results(results, args.format)
@@ -37,16 +37,13 @@ import os
 import shutil
 import argparse
 import yaml
+from file_walker import walk
 
 def classify_files_by_type(target_dir, type_dirs, type_exts):
-    # 获取目标文件夹下的所有文件
-    files = os.listdir(target_dir)
-    for file_name in files:
-        # 获取文件的全路径
-        file_path = os.path.join(target_dir, file_name)
-        # 如果是文件夹，跳过
-        if os.path.isdir(file_path):
-            continue
+    # 获取目标文件夹下的所有文件，跳过文件夹
+    for entry in list(walk(target_dir, dirs=False)):
+        file_name = entry.name
+        file_path = entry.path
         # 获取文件的扩展名
         file_ext = os.path.splitext(file_name)[-1].lower()
         # 判断文件的类型，并移动到对应的文件夹
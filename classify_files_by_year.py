@@ -27,21 +27,22 @@ import shutil
 import argparse
 import yaml
 from datetime import datetime
+from file_walker import walk
 
 def classify_files_and_folders_by_year(target_dirs, keep_current_year_files_in_root=True):
     for target_dir in target_dirs:
         # 获取目标文件夹下的所有文件和文件夹
-        items = os.listdir(target_dir)
+        items = list(walk(target_dir))
         current_year = datetime.now().year
-        for item_name in items:
-            # 获取项目的全路径
-            item_path = os.path.join(target_dir, item_name)
+        for item in items:
+            item_name = item.name
+            item_path = item.path
             # 如果项目是文件夹，并且它的名字是四位数（例如"2021"或"2022"），那么直接跳过
-            if os.path.isdir(item_path) and item_name.isdigit() and len(item_name) == 4:
+            if item.is_dir and item_name.isdigit() and len(item_name) == 4:
                 continue
             # 获取项目的创建时间和修改时间，并选择其中较早的一个，然后格式化为年份
-            create_time = os.path.getctime(item_path)
-            modify_time = os.path.getmtime(item_path)
+            create_time = item.stat.st_ctime
+            modify_time = item.stat.st_mtime
             item_year = datetime.fromtimestamp(min(create_time, modify_time)).year
             # 如果启用了keep_current_year_files_in_root选项，并且项目的年份是当前年份，那么直接跳过
             if keep_current_year_files_in_root and item_year == current_year:
@@ -17,6 +17,7 @@ multi_extract.py
 import os
 import subprocess
 import sys
+from file_walker import walk
 
 def extract_files(path):
     # 支持的压缩文件扩展名
@@ -27,25 +28,25 @@ def extract_files(path):
     while True:
         extracted_files = False
 
-        # 遍历路径下的所有文件和子目录
-        for root, _, files in os.walk(path):
-            for file in files:
-                if any(file.endswith(ext) for ext in extensions) and not file.startswith('.'):
-                    file_path = os.path.join(root, file)
-                    print(f'Extracting {file_path}...')
-                    total_files += 1
-
-                    # 调用 7z 命令来解压文件
-                    result = subprocess.run(['7z', 'x', file_path, f'-o{root}'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-                    # 检查是否成功解压
-                    if result.returncode != 0:
-                        print(f"An error occurred while extracting {file_path}: {result.stderr.decode().strip()}")
-                    else:
-                        # 删除原压缩文件
-                        os.remove(file_path)
-                        print(f"Progress: {total_files}")
-                        extracted_files = True
+        # 遍历路径下的所有压缩文件，包括子目录中的
+        for entry in walk(path, recursive=True, dirs=False, include=[f'*{ext}' for ext in extensions]):
+            if not entry.name.startswith('.'):
+                file_path = entry.path
+                root = os.path.dirname(file_path)
+                print(f'Extracting {file_path}...')
+                total_files += 1
+
+                # 调用 7z 命令来解压文件
+                result = subprocess.run(['7z', 'x', file_path, f'-o{root}'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+                # 检查是否成功解压
+                if result.returncode != 0:
+                    print(f"An error occurred while extracting {file_path}: {result.stderr.decode().strip()}")
+                else:
+                    # 删除原压缩文件
+                    os.remove(file_path)
+                    print(f"Progress: {total_files}")
+                    extracted_files = True
 
         # 如果在这一轮中没有解压任何文件，则退出循环
         if not extracted_files:
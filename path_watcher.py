@@ -48,6 +48,7 @@ import signal
 from typing import Any, Dict
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler, EVENT_TYPE_MOVED
+from file_walker import walk
 
 
 class MyHandler(FileSystemEventHandler):
@@ -81,17 +82,17 @@ class MyHandler(FileSystemEventHandler):
         paths = self.path if isinstance(self.path, list) else [self.path]
         for path in paths:
             if self.recursive:
-                for root, dirs, files in os.walk(path):
-                    for dir_name in dirs:
-                        if dir_name != os.path.basename(path):
-                            self.entry_list.append(os.path.relpath(os.path.join(root, dir_name), path) + "/")
-                    for file_name in files:
-                        self.entry_list.append(os.path.relpath(os.path.join(root, file_name), path))
+                for entry in walk(path, recursive=True):
+                    if entry.is_dir:
+                        if entry.name != os.path.basename(path):
+                            self.entry_list.append(os.path.relpath(entry.path, path) + "/")
+                    else:
+                        self.entry_list.append(os.path.relpath(entry.path, path))
             else:
-                for entry in os.scandir(path):
-                    if entry.is_dir() and not entry.is_symlink():
+                for entry in walk(path):
+                    if entry.is_dir and not entry.is_symlink:
                         self.entry_list.append(entry.name + "/")
-                    elif entry.is_file() and not entry.is_symlink():
+                    elif entry.is_file and not entry.is_symlink:
                         self.entry_list.append(entry.name)
 
     def save_entry_list_to_output(self):
@@ -4,11 +4,23 @@ rename_files.py
 这个脚本用于重命名指定目录中的所有文件。它将文件的扩展名更改为指定的前缀，并将其添加到文件名的开头，以形成"新前缀.原始文件名.日期.原始扩展名"的格式。
 
 用法：
-    python rename_files.py /path/to/your/directory [--add_date]
+    python rename_files.py /path/to/your/directory [--add_date] [--recursive] [--workers N] [--dry-run]
+    python rename_files.py /path/to/your/directory --undo [--journal JOURNAL]
 
 注意：
     你需要将 "/path/to/your/directory" 替换为你的目标文件夹的实际路径。
     使用 --add_date 参数可以将文件的最后修改日期添加到文件名中，如果文件名已经包含了日期，则不会重复添加。
+    使用 --recursive 参数可以同时处理所有子文件夹，各子文件夹的重命名计划会并行生成。
+    使用 --workers 参数可以指定执行重命名的线程数，在网络文件系统上可以明显加快速度。
+    使用 --dry-run 参数只打印重命名计划，不实际修改任何文件。
+    使用 --undo 参数可以根据撤销日志把上一次的重命名全部还原。
+
+执行过程：
+    重命名分为两个阶段。第一阶段先计算完整的"旧名称 -> 新名称"映射，去掉名称不变的条目，
+    并检查冲突：多个文件映射到同一个新名称，或新名称与计划之外的已有文件重名，这些文件会被跳过而不会覆盖。
+    如果新名称恰好是计划中另一个文件的旧名称（链式或循环重命名），这些文件会先移动到临时名称再改为最终名称。
+    第二阶段执行重命名，每一步都会立即追加写入撤销日志（默认为目标文件夹下的 .rename_files_journal.jsonl），
+    即使中途崩溃，也可以用 --undo 还原已经完成的部分。
 
 规则：
     匹配：^xlsx?(.*?)$ 替换：Excel\\1
@@ -28,74 +40,303 @@ rename_files.py
 import os
 import argparse
 import re
+import json
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from file_walker import walk
 
-def rename_files_in_directory(target_dir, add_date):
-    # 定义重命名规则
-    rules = [
-        (r'^xlsx?(.*?)$', 'Excel\\1'),
-        (r'^docx?(.*?)$', 'Word\\1'),
-        (r'^pptx?(.*?)$', 'PPT\\1'),
-        (r'^txt(.*?)$', 'Text\\1'),
-        (r'^(zip|7z|rar)(.*?)$', 'Archive\\2'),
-        (r'^(pdf|epub|mobi|azw3)(.*?)$', 'E-Book\\2'),
-        (r'^(json|xml|yaml|csv)(.*?)$', 'DataExchangeFormat\\2'),
-        (r'^(jpe?g|png|gif|bmp|svg)(.*?)$', 'Image\\2'),
-        (r'^(mp4|flv|webm|m4v|mov|mkv|avi)(.*?)$', 'Video\\2'),
-        (r'^(mp3|wav|flac|aac)(.*?)$', 'Audio\\2'),
-        (r'^colpkg(.*?)$', 'Anki\\1'),
-        (r'^vsdx?(.*?)$', 'Visio\\1')
-    ]
+# 定义重命名规则
+RULES = [
+    (r'^xlsx?(.*?)$', 'Excel\\1'),
+    (r'^docx?(.*?)$', 'Word\\1'),
+    (r'^pptx?(.*?)$', 'PPT\\1'),
+    (r'^txt(.*?)$', 'Text\\1'),
+    (r'^(zip|7z|rar)(.*?)$', 'Archive\\2'),
+    (r'^(pdf|epub|mobi|azw3)(.*?)$', 'E-Book\\2'),
+    (r'^(json|xml|yaml|csv)(.*?)$', 'DataExchangeFormat\\2'),
+    (r'^(jpe?g|png|gif|bmp|svg)(.*?)$', 'Image\\2'),
+    (r'^(mp4|flv|webm|m4v|mov|mkv|avi)(.*?)$', 'Video\\2'),
+    (r'^(mp3|wav|flac|aac)(.*?)$', 'Audio\\2'),
+    (r'^colpkg(.*?)$', 'Anki\\1'),
+    (r'^vsdx?(.*?)$', 'Visio\\1')
+]
+
+JOURNAL_NAME = '.rename_files_journal.jsonl'
 
-    # 遍历目标文件夹中的所有文件和文件夹
-    for filename in os.listdir(target_dir):
-        # 确保只处理文件
-        if os.path.isfile(os.path.join(target_dir, filename)):
-            # 获得文件的扩展名和基础名
-            base_name = os.path.splitext(filename)[0]
-            ext = os.path.splitext(filename)[-1].lstrip('.').lower()
-
-            # 对于每个规则，检查文件扩展名是否匹配
-            for pattern, replacement in rules:
-                if re.match(pattern, ext):
-                    # 如果匹配，使用替换模式生成新的文件名
-                    new_ext = re.sub(pattern, replacement, ext)
-                    # 只有在基础名不以新前缀开头时才添加新前缀
-                    if not base_name.startswith(new_ext):
-                        new_base_name = f"{new_ext}.{base_name}"
-                    else:
-                        new_base_name = base_name
-                    break
+
+def build_new_filename(filename, mtime, add_date):
+    # 获得文件的扩展名和基础名
+    base_name = os.path.splitext(filename)[0]
+    ext = os.path.splitext(filename)[-1].lstrip('.').lower()
+    # 没有扩展名的文件（包括 .gitignore 这样的点文件）保持原样，否则会被改名为"文件名."
+    if not ext:
+        return filename
+
+    # 对于每个规则，检查文件扩展名是否匹配
+    for pattern, replacement in RULES:
+        if re.match(pattern, ext):
+            # 如果匹配，使用替换模式生成新的文件名
+            new_ext = re.sub(pattern, replacement, ext)
+            # 只有在基础名不以新前缀开头时才添加新前缀
+            if not base_name.startswith(new_ext):
+                new_base_name = f"{new_ext}.{base_name}"
             else:
-                # 如果没有任何规则匹配，保持原样
                 new_base_name = base_name
+            break
+    else:
+        # 如果没有任何规则匹配，保持原样
+        new_base_name = base_name
 
-            # 如果需要添加日期，获取文件的最后修改时间并添加到文件名
-            if add_date:
-                mtime = os.path.getmtime(os.path.join(target_dir, filename))
-                date = datetime.fromtimestamp(mtime).strftime('%y-%m-%d')
-                # 只有在基础名不以日期格式结尾时才添加新日期
-                if not re.search(r'\d{2}-\d{2}-\d{2}$', new_base_name):
-                    new_filename = f"{new_base_name}.{date}.{ext}"
-                else:
-                    new_filename = f"{new_base_name}.{ext}"
-            else:
-                new_filename = f"{new_base_name}.{ext}"
+    # 如果需要添加日期，把文件的最后修改时间添加到文件名
+    if add_date:
+        date = datetime.fromtimestamp(mtime).strftime('%y-%m-%d')
+        # 只有在基础名不以日期格式结尾时才添加新日期
+        if not re.search(r'\d{2}-\d{2}-\d{2}$', new_base_name):
+            return f"{new_base_name}.{date}.{ext}"
+    return f"{new_base_name}.{ext}"
+
+
+def plan_directory(target_dir, add_date):
+    """
+    第一阶段：计算单个文件夹的重命名计划，不修改任何文件。
+
+    返回 (renames, skipped)，renames 是 (旧路径, 新路径) 列表，已经去掉了名称不变的条目；
+    skipped 是 (旧路径, 新路径, 原因) 列表，记录因冲突而被跳过的文件。
+    """
+    mapping = {}
+    existing = set()
+    for entry in walk(target_dir):
+        existing.add(entry.name)
+        # 确保只处理文件，并跳过撤销日志本身
+        if not entry.is_file or entry.name == JOURNAL_NAME:
+            continue
+        new_filename = build_new_filename(entry.name, entry.stat.st_mtime, add_date)
+        if new_filename != entry.name:
+            mapping[entry.name] = new_filename
+
+    # 统计每个新名称对应的旧名称，找出多个文件映射到同一个新名称的情况
+    targets = {}
+    for old, new in mapping.items():
+        targets.setdefault(new, []).append(old)
+
+    renames = []
+    skipped = []
+    for old, new in mapping.items():
+        old_path = os.path.join(target_dir, old)
+        new_path = os.path.join(target_dir, new)
+        if len(targets[new]) > 1:
+            skipped.append((old_path, new_path, 'multiple files map to this name'))
+        elif new in existing and new not in mapping:
+            # 新名称被一个不会被移走的文件占用，重命名会覆盖它
+            skipped.append((old_path, new_path, 'target already exists'))
+        else:
+            renames.append((old_path, new_path))
+
+    # 被跳过的文件仍然占用着自己的旧名称，以它为目标的重命名也必须跳过
+    blocked = {old for old, _, _ in skipped}
+    while True:
+        dropped = [(old, new) for old, new in renames if new in blocked]
+        if not dropped:
+            break
+        renames = [(old, new) for old, new in renames if new not in blocked]
+        blocked.update(old for old, _ in dropped)
+        skipped.extend((old, new, 'target is blocked by a skipped file') for old, new in dropped)
+
+    return renames, skipped
+
+
+def plan_renames(target_dir, add_date, recursive=False, workers=1):
+    # 只重命名文件而不重命名文件夹，所以每个文件夹的计划互不影响，可以并行生成
+    if recursive:
+        # 与 os.walk 一致，不处理指向文件夹的符号链接，否则同一个文件夹会被计划两次，或者改到目标文件夹之外的文件
+        dirs = [target_dir] + [entry.path for entry in walk(target_dir, recursive=True, files=False, workers=workers)
+                               if not entry.is_symlink]
+    else:
+        dirs = [target_dir]
+
+    renames = []
+    skipped = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for dir_renames, dir_skipped in executor.map(lambda d: plan_directory(d, add_date), dirs):
+            renames.extend(dir_renames)
+            skipped.extend(dir_skipped)
+    return renames, skipped
+
+
+def find_cycles(renames):
+    # 找出循环重命名，例如 a -> b, b -> a
+    mapping = dict(renames)
+    cycles = []
+    visited = set()
+    for start in mapping:
+        if start in visited:
+            continue
+        path = []
+        node = start
+        while node in mapping and node not in visited:
+            visited.add(node)
+            path.append(node)
+            node = mapping[node]
+        if node in path:
+            cycles.append(path[path.index(node):])
+    return cycles
+
+
+class RenameJournal:
+    """
+    撤销日志：每一步重命名执行之前先追加一行 JSON 并立即写入磁盘，崩溃后也能据此还原。
+
+    路径以绝对路径保存，所以可以在任何当前目录下执行 --undo。
+    """
+
+    def __init__(self, journal_path):
+        self.journal_path = journal_path
+        self.lock = threading.Lock()
+        self.f = None
+
+    def __enter__(self):
+        self.f = open(self.journal_path, 'w', encoding='utf8')
+        return self
+
+    def __exit__(self, *exc_info):
+        self.f.close()
+
+    def record(self, src, dst):
+        with self.lock:
+            self.f.write(json.dumps({'src': os.path.abspath(src), 'dst': os.path.abspath(dst)}, ensure_ascii=False) + '\n')
+            self.f.flush()
+            os.fsync(self.f.fileno())
+
+
+def target_is_free(src, dst):
+    # 在不区分大小写的文件系统上，只改变大小写的重命名（例如 .XLS -> .xls）中 dst 就是 src 本身
+    return not os.path.exists(dst) or os.path.samefile(src, dst)
+
+
+def apply_renames(renames, journal_path, workers=1):
+    """
+    第二阶段：执行重命名计划，并把每一步写入撤销日志。
+
+    新名称恰好是计划中其他文件旧名称的条目（链式或循环重命名）会先移动到临时名称，
+    这样第二步的所有重命名之间都没有依赖，可以放心地并行执行。
+    """
+    targets = {new for _, new in renames}
+    staged = []
+    final = []
+    for old, new in renames:
+        if old in targets:
+            temp_path = os.path.join(os.path.dirname(old), f".rename_files_tmp.{uuid.uuid4().hex}")
+            staged.append((old, temp_path))
+            final.append((temp_path, new))
+        else:
+            final.append((old, new))
+
+    errors = []
+
+    with RenameJournal(journal_path) as journal:
+        def rename(step):
+            src, dst = step
+            try:
+                # 执行前再检查一次，防止覆盖计划生成之后才出现的文件，或临时移动失败而仍在原处的文件
+                if not target_is_free(src, dst):
+                    raise FileExistsError(f"{dst} already exists")
+                # 先写日志再重命名，即使在两者之间崩溃，--undo 也知道文件可能在哪里
+                journal.record(src, dst)
+                os.rename(src, dst)
+            except OSError as e:
+                errors.append((src, dst, e))
+                return False
+            return True
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # 临时名称移动失败的文件仍在原处，对应的最终重命名也不能执行
+            failed_temps = {temp for (_, temp), ok in zip(staged, executor.map(rename, staged)) if not ok}
+            final = [step for step in final if step[0] not in failed_temps]
+            done = sum(executor.map(rename, final))
+
+    return done, errors
+
+
+def undo_renames(journal_path, workers=1):
+    # 按相反的顺序回放撤销日志。同一阶段内的步骤互不依赖，所以可以并行，但阶段之间必须保持顺序
+    with open(journal_path, 'r', encoding='utf8') as f:
+        steps = [json.loads(line) for line in f if line.strip()]
+
+    temps = {step['dst'] for step in steps if os.path.basename(step['dst']).startswith('.rename_files_tmp.')}
+    phases = [
+        [s for s in reversed(steps) if s['dst'] not in temps],
+        [s for s in reversed(steps) if s['dst'] in temps],
+    ]
+
+    errors = []
+
+    def rename(step):
+        # 日志是在重命名之前写入的，dst 不存在说明这一步没有执行，直接跳过
+        if not os.path.exists(step['dst']):
+            return False
+        try:
+            if not target_is_free(step['dst'], step['src']):
+                raise FileExistsError(f"{step['src']} already exists")
+            os.rename(step['dst'], step['src'])
+        except OSError as e:
+            errors.append((step['dst'], step['src'], e))
+            return False
+        return True
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        done = sum(executor.map(rename, phases[0]))
+        # 临时名称的步骤不计入还原的文件数
+        list(executor.map(rename, phases[1]))
+    return done, errors
+
+
+def rename_files_in_directory(target_dir, add_date, recursive=False, workers=1, journal_path=None, dry_run=False):
+    journal_path = journal_path or os.path.join(target_dir, JOURNAL_NAME)
+
+    renames, skipped = plan_renames(target_dir, add_date, recursive, workers)
+    for old, new, reason in skipped:
+        print(f"Skipping {old} -> {new}: {reason}")
+    for cycle in find_cycles(renames):
+        print(f"Cycle detected, resolving through temporary names: {' -> '.join(cycle)}")
+
+    if dry_run:
+        for old, new in renames:
+            print(f"{old} -> {new}")
+        print(f"{len(renames)} files would be renamed, {len(skipped)} skipped.")
+        return
+
+    if not renames:
+        print(f"Nothing to rename, {len(skipped)} skipped.")
+        return
 
-            # 获取文件的原始路径和新路径
-            old_file_path = os.path.join(target_dir, filename)
-            new_file_path = os.path.join(target_dir, new_filename)
+    done, errors = apply_renames(renames, journal_path, workers)
+    for src, dst, e in errors:
+        print(f"Error renaming {src} -> {dst}: {e}")
+    print(f"Renamed {done} files, {len(skipped)} skipped, {len(errors)} errors. Undo journal: {journal_path}")
 
-            # 重命名文件
-            os.rename(old_file_path, new_file_path)
 
-# 创建一个解析器
-parser = argparse.ArgumentParser(description='Rename files in a directory.')
-# 添加一个命令行参数
-parser.add_argument('directory', help='The directory where files will be renamed.')
-parser.add_argument('--add_date', action='store_true', help='Add the last modified date to the filename.')
-# 解析命令行参数
-args = parser.parse_args()
+if __name__ == "__main__":
+    # 创建一个解析器
+    parser = argparse.ArgumentParser(description='Rename files in a directory.')
+    # 添加命令行参数
+    parser.add_argument('directory', help='The directory where files will be renamed.')
+    parser.add_argument('--add_date', action='store_true', help='Add the last modified date to the filename.')
+    parser.add_argument('--recursive', action='store_true', help='Also rename files in all subdirectories.')
+    parser.add_argument('--workers', type=int, default=1, help='Number of threads used to plan and apply renames.')
+    parser.add_argument('--dry-run', action='store_true', help='Only print the rename plan.')
+    parser.add_argument('--journal', help=f'Path of the undo journal. Defaults to {JOURNAL_NAME} in the directory.')
+    parser.add_argument('--undo', action='store_true', help='Revert the renames recorded in the undo journal.')
+    # 解析命令行参数
+    args = parser.parse_args()
 
-# 调用函数
-rename_files_in_directory(args.directory, args.add_date)
+    if args.undo:
+        journal_path = args.journal or os.path.join(args.directory, JOURNAL_NAME)
+        done, errors = undo_renames(journal_path, args.workers)
+        for src, dst, e in errors:
+            print(f"Error restoring {src} -> {dst}: {e}")
+        print(f"Restored {done} files, {len(errors)} errors.")
+    else:
+        # 调用函数
+        rename_files_in_directory(args.directory, args.add_date, args.recursive, args.workers, args.journal, args.dry_run)
@@ -8,6 +8,18 @@
 - playlist-c：歌单C的名称。程序会将不符合筛选条件的歌曲添加到这个歌单。
 - filter：筛选条件。可以是 "contains_chinese" 或 "not_contains_chinese"。前者会筛选出名称中包含中文的歌曲，后者会筛选出名称中不包含中文的歌曲。
 
+读取歌单时只请求歌曲的 id、uri 和 name 字段，并在得到歌曲总数后并发获取其余分页。
+
+所有 API 调用都经过同一个限速器：遇到 429 时按 Retry-After 暂停所有请求并降低速率，失败的请求按指数退避重试，不会丢失。
+
+程序会在本地记录每个歌单的 snapshot_id 和歌曲 ID 集合。每次运行时只获取歌单的 snapshot_id，
+没有变化的歌单直接使用本地记录，源歌单中也只有上次运行之后新增的歌曲，以及上次添加失败或缺少音频特征的歌曲才会被分类。使用 --full 参数可以忽略本地记录，重新分类所有歌曲。
+
+歌曲的音频特征（用于情绪分类）会按每批 100 首获取，并缓存到本地的 SQLite 文件中。已经缓存过的歌曲不会再次请求 Spotify API。
+
+同步逻辑都在 manage_playlists() 中，客户端通过参数传入，可以替换为模拟客户端。
+spotify_playlist_manager_benchmark.py 使用模拟的 Spotify 客户端，在本地测量 API 调用次数、耗时和限速等待时间。
+
 这些参数也可以通过一个名为 "spotify_playlist_manager_config.yaml" 的配置文件提供。配置文件应该放在程序所在路径的 "config" 目录下。
 
 配置文件的结构如下：
@@ -20,6 +32,10 @@ filter: "contains_chinese"
 client_id: "Your Spotify App Client ID"
 client_secret: "Your Spotify App Client Secret"
 redirect_uri: "Your Spotify App Redirect URI"
+requests_per_second: 10  # 可选，所有 API 调用共享的速率上限（每秒请求数）
+fetch_workers: 8  # 可选，并发获取歌单分页的线程数
+state_path: "cache/spotify_playlist_state.sqlite"  # 可选，增量同步状态文件的路径，相对路径以程序所在路径为基准
+feature_cache_path: "cache/spotify_audio_features.sqlite"  # 可选，音频特征缓存文件的路径，相对路径以程序所在路径为基准
 
 """
 
@@ -28,33 +44,92 @@ import argparse
 import yaml
 import time
 import re
+import json
+import sqlite3
+import requests
 import spotipy
 from spotipy.oauth2 import SpotifyOAuth
 import collections
-
-# 定义命令行参数
-parser = argparse.ArgumentParser(description='Manage Spotify playlists.')
-parser.add_argument('--playlist-a', help='Name of Playlist A')
-parser.add_argument('--filter', help='Filter condition for language')
-args = parser.parse_args()
-
-# 读取配置文件
-print("Reading configuration file...")
-config_path = os.path.join(os.path.dirname(__file__), 'config', 'spotify_playlist_manager_config.yaml')
-with open(config_path, 'r', encoding="utf8") as f:
-    config = yaml.safe_load(f)
-
-print("Setting up configurations...")
-if args.playlist_a:
-    config['playlist_a'] = args.playlist_a
-if args.filter:
-    config['filter'] = args.filter
-
-print("Connecting to Spotify...")
-sp = spotipy.Spotify(auth_manager=SpotifyOAuth(client_id=config['client_id'],
-                                               client_secret=config['client_secret'],
-                                               redirect_uri=config['redirect_uri'],
-                                               scope='playlist-modify-public'))
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+class RateLimitedClient:
+    """
+    包装 spotipy.Spotify，所有 API 调用都经过同一个令牌桶限速。
+
+    遇到 429 时按 Retry-After 暂停所有线程的调用，并把速率减半（不低于每秒 1 次或配置的速率）；之后每次成功调用都会缓慢恢复速率。
+    令牌桶的容量至少为 1，速率低于每秒 1 次时仍然可以攒够一个令牌。
+    429 和 5xx 错误会按指数退避重试，stats 记录调用次数、429 次数、重试次数和等待的总时间。
+    WRITE_METHODS 中的写操作不是幂等的：5xx 时请求可能已经生效，重试会重复添加歌曲，所以只在 429 时重试。
+    """
+
+    WRITE_METHODS = {'playlist_add_items', 'playlist_remove_all_occurrences_of_items'}
+
+    def __init__(self, client, rate=10.0, max_retries=5, backoff=1.0):
+        self.client = client
+        self.max_rate = rate
+        self.min_rate = min(1.0, rate)
+        self.rate = rate
+        self.tokens = max(1.0, rate)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.last_refill = time.monotonic()
+        self.pause_until = 0.0
+        self.lock = threading.Lock()
+        self.stats = {'calls': 0, 'rate_limited': 0, 'retries': 0, 'wait_time': 0.0}
+
+    def __getattr__(self, name):
+        attr = getattr(self.client, name)
+        if not callable(attr):
+            return attr
+        idempotent = name not in self.WRITE_METHODS
+        return lambda *args, **kwargs: self.call(attr, *args, idempotent=idempotent, **kwargs)
+
+    def _acquire(self):
+        # 等待全局的 Retry-After 暂停结束，并从令牌桶中取出一个令牌
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(max(1.0, self.rate), self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                if now >= self.pause_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    self.stats['calls'] += 1
+                    return
+                wait = max(self.pause_until - now, (1 - self.tokens) / self.rate)
+                self.stats['wait_time'] += wait
+            time.sleep(wait)
+
+    def call(self, func, *args, idempotent=True, **kwargs):
+        attempt = 0
+        while True:
+            self._acquire()
+            try:
+                result = func(*args, **kwargs)
+            except spotipy.SpotifyException as e:
+                if e.http_status != 429 and not (idempotent and e.http_status and e.http_status >= 500):
+                    raise
+                if attempt >= self.max_retries:
+                    raise
+                delay = self.backoff * 2 ** attempt
+                with self.lock:
+                    self.stats['retries'] += 1
+                    if e.http_status == 429:
+                        self.stats['rate_limited'] += 1
+                        retry_after = int((e.headers or {}).get('Retry-After', 0))
+                        delay = max(delay, retry_after)
+                        self.pause_until = max(self.pause_until, time.monotonic() + delay)
+                        self.rate = max(self.rate / 2, self.min_rate)
+                print(f"Request failed with status {e.http_status}, retrying in {delay} seconds...")
+                if e.http_status != 429:
+                    with self.lock:
+                        self.stats['wait_time'] += delay
+                    time.sleep(delay)
+                attempt += 1
+                continue
+            with self.lock:
+                self.rate = min(self.max_rate, self.rate + 0.1)
+            return result
 
 def classify_language(song):
     if song and song.get('track') and song['track'].get('name'):
@@ -97,84 +172,258 @@ def classify_emotion(track_features):
 
     return emotions
 
-# 获取歌单 A 的所有歌曲
-def get_all_songs(playlist_id):
-    all_songs = []
-    response = sp.playlist_tracks(playlist_id)
+# 单次 audio_features 请求最多能查询的歌曲数量
+AUDIO_FEATURES_BATCH_SIZE = 100
+
+# Spotify 没有返回音频特征的歌曲，在这段时间内不再重新请求（秒）
+MISSING_FEATURES_RETRY_INTERVAL = 7 * 24 * 3600
+
+class AudioFeatureCache:
+    """以歌曲 ID 为键，把音频特征持久化到本地 SQLite 文件中。没有音频特征的歌曲单独记录最后一次查询的时间。"""
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS audio_features (track_id TEXT PRIMARY KEY, features TEXT NOT NULL)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS missing_audio_features (track_id TEXT PRIMARY KEY, checked_at REAL NOT NULL)')
+
+    def get_many(self, track_ids):
+        cached = {}
+        track_ids = list(track_ids)
+        # SQLite 对单条语句的参数数量有限制，所以分批查询
+        for start in range(0, len(track_ids), 500):
+            chunk = track_ids[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            rows = self.conn.execute(f'SELECT track_id, features FROM audio_features WHERE track_id IN ({placeholders})', chunk)
+            cached.update((track_id, json.loads(features)) for track_id, features in rows)
+        return cached
+
+    def put_many(self, features_by_id):
+        with self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO audio_features (track_id, features) VALUES (?, ?)',
+                                  [(track_id, json.dumps(features)) for track_id, features in features_by_id.items()])
+
+    def get_recently_missing(self, track_ids, max_age):
+        """返回在 max_age 秒内确认过没有音频特征的歌曲 ID 集合。"""
+        recently_missing = set()
+        track_ids = list(track_ids)
+        for start in range(0, len(track_ids), 500):
+            chunk = track_ids[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            rows = self.conn.execute(f'SELECT track_id FROM missing_audio_features WHERE track_id IN ({placeholders}) AND checked_at > ?',
+                                     chunk + [time.time() - max_age])
+            recently_missing.update(track_id for track_id, in rows)
+        return recently_missing
+
+    def put_missing(self, track_ids):
+        with self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO missing_audio_features (track_id, checked_at) VALUES (?, ?)',
+                                  [(track_id, time.time()) for track_id in track_ids])
+
+    def close(self):
+        self.conn.close()
+
+def get_audio_features(sp, track_ids, cache):
+    """
+    返回 {歌曲 ID: 音频特征}。只有缓存中没有的歌曲才会按每批 100 首请求 API。
+
+    最近确认过没有音频特征的歌曲不会再次请求，也不会出现在返回结果中。
+    """
+    track_ids = list(dict.fromkeys(track_ids))
+    features_by_id = cache.get_many(track_ids)
+    uncached_ids = [track_id for track_id in track_ids if track_id not in features_by_id]
+    recently_missing = cache.get_recently_missing(uncached_ids, MISSING_FEATURES_RETRY_INTERVAL)
+    missing_ids = [track_id for track_id in uncached_ids if track_id not in recently_missing]
+    print(f"Found audio features for {len(features_by_id)} songs in the local cache, "
+          f"{len(recently_missing)} songs recently had none, fetching {len(missing_ids)} from Spotify...")
+
+    for start in range(0, len(missing_ids), AUDIO_FEATURES_BATCH_SIZE):
+        chunk = missing_ids[start:start + AUDIO_FEATURES_BATCH_SIZE]
+        fetched = {}
+        for track_id, track_features in zip(chunk, sp.audio_features(chunk)):
+            # 没有音频特征的歌曲返回 None，只记录查询时间，过了 MISSING_FEATURES_RETRY_INTERVAL 之后再尝试
+            if track_features:
+                fetched[track_id] = track_features
+        cache.put_many(fetched)
+        cache.put_missing([track_id for track_id in chunk if track_id not in fetched])
+        features_by_id.update(fetched)
+
+    return features_by_id
+
+# 单次 playlist_items 请求最多能返回的歌曲数量
+PLAYLIST_PAGE_SIZE = 100
+# 只请求分类和写入需要的字段，减小每一页的响应体积
+PLAYLIST_ITEM_FIELDS = 'total,items(track(id,uri,name))'
+
+def get_playlist_page(sp, playlist_id, offset):
+    return sp.playlist_items(playlist_id, fields=PLAYLIST_ITEM_FIELDS, limit=PLAYLIST_PAGE_SIZE,
+                             offset=offset, additional_types=('track',))
+
+# 获取歌单的所有歌曲
+def get_all_songs(sp, playlist_id, fetch_workers=8):
+    """先取第一页得到歌曲总数，再用线程池并发请求其余各页。"""
+    response = get_playlist_page(sp, playlist_id, 0)
     total_tracks = response.get('total', 0)
     print(f"Getting information for {total_tracks} songs from the playlist...")
 
-    while response:
-        items = response.get('items', [])
-        all_songs.extend(items)
-        print(f"Fetching information for songs {len(all_songs)+1}-{len(all_songs)+len(items)}...")
-        response = sp.next(response)
-
+    pages = [response.get('items', [])]
+    offsets = range(PLAYLIST_PAGE_SIZE, total_tracks, PLAYLIST_PAGE_SIZE)
+    if offsets:
+        with ThreadPoolExecutor(max_workers=fetch_workers) as executor:
+            # executor.map 按 offset 的顺序返回结果，所以歌曲顺序与歌单一致
+            for page in executor.map(lambda offset: get_playlist_page(sp, playlist_id, offset), offsets):
+                pages.append(page.get('items', []))
+
+    # 已从 Spotify 下架的歌曲 track 字段为空，直接跳过
+    all_songs = [item for page in pages for item in page if item.get('track')]
+    print(f"Fetched information for {len(all_songs)} songs in {len(pages)} pages.")
     return all_songs, [item['track']['id'] for item in all_songs]
 
-print("Fetching songs from playlist {}...".format(config['playlist_a']))
-songs, song_ids = get_all_songs(config['playlist_a'])
-existing_song_ids = {config['playlist_a']: set(song_ids)}
-
-for key in config['languages'].values():
-    _, song_ids = get_all_songs(key)
-    existing_song_ids[key] = set(song_ids)
-
-for key in config['emotions'].values():
-    _, song_ids = get_all_songs(key)
-    existing_song_ids[key] = set(song_ids)
-
-print(f"Found {len(songs)} songs in the source playlist.")
-
-print("Classifying songs based on language and emotion...")
-for i, song_item in enumerate(songs):
-    track = song_item['track']
-
-    # 显示歌曲信息
-    print(f"{i+1}/{len(songs)} Song: {track['name']}")
-
-    # 进行语言分类
-    print("    Classifying song based on language...")
-    language = classify_language(song_item)
-    print(f"    Song is classified as {language}.")
-    language_playlist_id = config['languages'].get(language)
-    if track['uri'] and language_playlist_id and track['id'] not in existing_song_ids[language_playlist_id]:
+class SyncState:
+    """把每个歌单的 snapshot_id 和歌曲 ID 集合持久化到本地 SQLite 文件中，用于增量同步。"""
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS playlists (playlist_id TEXT PRIMARY KEY, snapshot_id TEXT NOT NULL, track_ids TEXT NOT NULL)')
+        # 需要在下次运行时重新分类的歌曲（添加失败或缺少音频特征），与歌单的 snapshot_id 分开保存
+        self.conn.execute('CREATE TABLE IF NOT EXISTS pending_tracks (playlist_id TEXT NOT NULL, track_id TEXT NOT NULL, track TEXT NOT NULL, '
+                          'PRIMARY KEY (playlist_id, track_id))')
+
+    def get(self, playlist_id):
+        row = self.conn.execute('SELECT snapshot_id, track_ids FROM playlists WHERE playlist_id = ?', (playlist_id,)).fetchone()
+        if row is None:
+            return None, None
+        return row[0], set(json.loads(row[1]))
+
+    def put(self, playlist_id, snapshot_id, track_ids):
+        with self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO playlists (playlist_id, snapshot_id, track_ids) VALUES (?, ?, ?)',
+                              (playlist_id, snapshot_id, json.dumps(sorted(track_ids, key=str))))
+
+    def get_pending(self, playlist_id):
+        rows = self.conn.execute('SELECT track FROM pending_tracks WHERE playlist_id = ?', (playlist_id,))
+        return [json.loads(track) for track, in rows]
+
+    def put_pending(self, playlist_id, tracks):
+        with self.conn:
+            self.conn.execute('DELETE FROM pending_tracks WHERE playlist_id = ?', (playlist_id,))
+            self.conn.executemany('INSERT OR REPLACE INTO pending_tracks (playlist_id, track_id, track) VALUES (?, ?, ?)',
+                                  [(playlist_id, track['id'], json.dumps(track)) for track in tracks])
+
+    def close(self):
+        self.conn.close()
+
+def get_playlist_snapshot(sp, playlist_id):
+    return sp.playlist(playlist_id, fields='snapshot_id')['snapshot_id']
+
+def load_playlist(sp, playlist_id, sync_state, full, fetch_workers=8):
+    """
+    返回 (snapshot_id, 歌曲 ID 集合, 歌曲列表)。
+
+    snapshot_id 与本地记录相同时直接使用记录的歌曲 ID 集合，不再下载歌单，此时歌曲列表为 None。
+    """
+    snapshot_id = get_playlist_snapshot(sp, playlist_id)
+    saved_snapshot_id, saved_track_ids = sync_state.get(playlist_id)
+    if not full and saved_snapshot_id == snapshot_id:
+        print(f"Playlist {playlist_id} is unchanged since the last run, using {len(saved_track_ids)} saved song IDs.")
+        return snapshot_id, saved_track_ids, None
+    songs, song_ids = get_all_songs(sp, playlist_id, fetch_workers)
+    return snapshot_id, set(song_ids), songs
+
+# 单次 playlist_add_items 请求最多能添加的歌曲数量
+ADD_ITEMS_BATCH_SIZE = 100
+
+# 一批歌曲因限速被放回队列的最多次数
+MAX_REQUEUE = 3
+
+def add_items_to_playlists(sp, pending_uris, playlist_names):
+    """
+    按每批 100 首把歌曲写入各个歌单，返回 ({歌单 ID: 成功添加的 URI 列表}, {歌单 ID: 最后一次写入后的 snapshot_id})。
+
+    限速重试用尽的批次会放回队列末尾，等限速器的暂停结束后再试；放回次数用尽后整批视为失败，不计入返回结果，
+    下次运行时由同步状态重新添加。5xx 错误的批次同样留到下次运行。其他错误的批次拆成单首重试，避免一个无效 URI 导致整批歌曲丢失。
+    """
+    added = collections.defaultdict(list)
+    snapshots = {}
+    queue = collections.deque()
+    for playlist_id, uris in pending_uris.items():
+        for start in range(0, len(uris), ADD_ITEMS_BATCH_SIZE):
+            queue.append((playlist_id, uris[start:start + ADD_ITEMS_BATCH_SIZE], 0))
+
+    while queue:
+        playlist_id, chunk, requeued = queue.popleft()
+        name = playlist_names[playlist_id]
         try:
-            sp.playlist_add_items(language_playlist_id, [track['uri']])
-            print(f"    Added song to {language} Playlist: {track['name']}")
+            snapshots[playlist_id] = sp.playlist_add_items(playlist_id, chunk)['snapshot_id']
+            added[playlist_id].extend(chunk)
         except spotipy.SpotifyException as e:
-            if 'Unsupported URL / URI.' in str(e):
-                print(f"Cannot add song {track['name']} due to unsupported URI. The song might have been removed from Spotify.")
-            elif 'Retry-After' in e.headers:
-                print(f"Rate limit exceeded, waiting for {e.headers['Retry-After']} seconds")
-                time.sleep(int(e.headers['Retry-After']) + 2)
+            if e.http_status == 429 and requeued < MAX_REQUEUE:
+                print(f"Rate limit exceeded while adding {len(chunk)} songs to {name} Playlist, requeuing them.")
+                queue.append((playlist_id, chunk, requeued + 1))
+            elif e.http_status == 429:
+                # 仍在限速时拆成单首请求只会成倍增加调用次数，整批留到下次运行
+                print(f"Rate limit exceeded while adding {len(chunk)} songs to {name} Playlist, giving up on them for this run.")
+            elif e.http_status and e.http_status >= 500:
+                # 服务端错误时这批歌曲可能已经添加成功，重试会重复添加；留到下次运行，由重新读取的目标歌单去重
+                print(f"Server error while adding {len(chunk)} songs to {name} Playlist, leaving them for the next run: {e}")
+            elif len(chunk) > 1:
+                print(f"Error adding {len(chunk)} songs to {name} Playlist, retrying one by one: {e}")
+                queue.extend((playlist_id, [uri], requeued) for uri in chunk)
+            elif 'Unsupported URL / URI.' in str(e):
+                print(f"Cannot add song {chunk[0]} due to unsupported URI. The song might have been removed from Spotify.")
             else:
-                print(f"Error adding song to {language} Playlist: {e}")
-
-    # 进行情绪分类
-    print("    Classifying song based on emotion...")
-    if track['id']:
-        track_features = sp.audio_features([track['id']])[0]
-        emotions = classify_emotion(track_features)
-        print(f"    Song is classified with emotions: {emotions}.")
-        for emotion in emotions:
-            emotion_playlist_id = config['emotions'].get(emotion)
-            if track['uri'] and emotion_playlist_id and track['id'] not in existing_song_ids[emotion_playlist_id]:
-                try:
-                    sp.playlist_add_items(emotion_playlist_id, [track['uri']])
-                    print(f"    Added song to {emotion} Playlist: {track['name']}")
-                except spotipy.SpotifyException as e:
-                    if 'Unsupported URL / URI.' in str(e):
-                        print(f"Cannot add song {track['name']} due to unsupported URI. The song might have been removed from Spotify.")
-                    elif 'Retry-After' in e.headers:
-                        print(f"Rate limit exceeded, waiting for {e.headers['Retry-After']} seconds")
-                        time.sleep(int(e.headers['Retry-After']) + 2)
-                    else:
-                        print(f"Error adding song to {emotion} Playlist: {e}")
-    else:
-        print(f"    Skipping emotion classification for song {i+1}/{len(songs)} due to missing track ID.")
-
-def remove_duplicates_from_playlist(playlist_id, existing_song_ids):
+                print(f"Error adding song {chunk[0]} to {name} Playlist: {e}")
+    return added, snapshots
+
+def classify_songs(songs, audio_features, config, existing_song_ids):
+    """
+    对歌曲进行语言和情绪分类，返回 ({歌单 ID: 待添加的 URI 列表}, {歌单 ID: 分类名称}, {URI: 歌曲 ID})。
+
+    已经在目标歌单中的歌曲不会加入待添加列表，并且会被加入 existing_song_ids，保证同一首歌在一次运行中不会重复添加。
+    """
+    pending_uris = collections.defaultdict(list)
+    playlist_names = {}
+    track_ids_by_uri = {}
+
+    def queue_song(playlist_id, name, track):
+        playlist_names[playlist_id] = name
+        if track['id'] not in existing_song_ids[playlist_id]:
+            existing_song_ids[playlist_id].add(track['id'])
+            pending_uris[playlist_id].append(track['uri'])
+            track_ids_by_uri[track['uri']] = track['id']
+            print(f"    Queued song for {name} Playlist: {track['name']}")
+
+    for i, song_item in enumerate(songs):
+        track = song_item['track']
+
+        # 显示歌曲信息
+        print(f"{i+1}/{len(songs)} Song: {track['name']}")
+
+        # 进行语言分类
+        print("    Classifying song based on language...")
+        language = classify_language(song_item)
+        print(f"    Song is classified as {language}.")
+        language_playlist_id = config['languages'].get(language)
+        if track['uri'] and language_playlist_id:
+            queue_song(language_playlist_id, language, track)
+
+        # 进行情绪分类
+        print("    Classifying song based on emotion...")
+        track_features = audio_features.get(track['id'])
+        if track_features:
+            emotions = classify_emotion(track_features)
+            print(f"    Song is classified with emotions: {emotions}.")
+            for emotion in emotions:
+                emotion_playlist_id = config['emotions'].get(emotion)
+                if track['uri'] and emotion_playlist_id:
+                    queue_song(emotion_playlist_id, emotion, track)
+        else:
+            print(f"    Skipping emotion classification for song {i+1}/{len(songs)} due to missing audio features.")
+
+    return pending_uris, playlist_names, track_ids_by_uri
+
+def remove_duplicates_from_playlist(sp, playlist_id, existing_song_ids):
     song_ids_in_playlist = existing_song_ids[playlist_id]
     duplicate_ids = [item for item, count in collections.Counter(song_ids_in_playlist).items() if count > 1]
 
@@ -188,11 +437,120 @@ def remove_duplicates_from_playlist(playlist_id, existing_song_ids):
     if duplicate_ids:
         print(f"Finished removing duplicates from playlist ID {playlist_id}.")
 
-# 用于每个歌单
-remove_duplicates_from_playlist(config['playlist_a'], existing_song_ids)
-for playlist_id in config['languages'].values():
-    remove_duplicates_from_playlist(playlist_id, existing_song_ids)
-
-print("All songs have been classified and added to the respective playlists.")
-print("\nTask Completed!")
-
+def resolve_path(path):
+    # 相对路径以程序所在路径为基准
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+
+def manage_playlists(sp, config, full=False):
+    """
+    执行一次完整的同步：读取歌单、分类源歌单中的新歌曲、写入目标歌单并保存同步状态。
+
+    sp 可以是任何提供 spotipy.Spotify 同名方法的客户端，例如包装了真实客户端或模拟客户端的 RateLimitedClient。
+    """
+    fetch_workers = config.get('fetch_workers', 8)
+    sync_state = SyncState(resolve_path(config.get('state_path', os.path.join('cache', 'spotify_playlist_state.sqlite'))))
+    snapshot_ids = {}
+    existing_song_ids = {}
+
+    print("Fetching songs from playlist {}...".format(config['playlist_a']))
+    snapshot_ids[config['playlist_a']], existing_song_ids[config['playlist_a']], songs = load_playlist(sp, config['playlist_a'], sync_state, full, fetch_workers)
+    if songs is None:
+        songs = []
+    elif not full:
+        # 只分类上次运行之后新增的歌曲
+        _, classified_song_ids = sync_state.get(config['playlist_a'])
+        if classified_song_ids:
+            songs = [song_item for song_item in songs if song_item['track']['id'] not in classified_song_ids]
+
+    for key in list(config['languages'].values()) + list(config['emotions'].values()):
+        snapshot_ids[key], existing_song_ids[key], _ = load_playlist(sp, key, sync_state, full, fetch_workers)
+
+    print(f"Found {len(songs)} new songs in the source playlist.")
+    if not full:
+        # 加上上次没有完成分类的歌曲，已经从源歌单中移除的除外
+        new_song_ids = {song_item['track']['id'] for song_item in songs}
+        pending = [track for track in sync_state.get_pending(config['playlist_a'])
+                   if track['id'] in existing_song_ids[config['playlist_a']] and track['id'] not in new_song_ids]
+        if pending:
+            print(f"Retrying {len(pending)} songs that were not fully classified in earlier runs.")
+            songs = songs + [{'track': track} for track in pending]
+
+    print("Fetching audio features...")
+    feature_cache = AudioFeatureCache(resolve_path(config.get('feature_cache_path', os.path.join('cache', 'spotify_audio_features.sqlite'))))
+    audio_features = get_audio_features(sp, [song_item['track']['id'] for song_item in songs if song_item['track']['id']], feature_cache)
+    feature_cache.close()
+    # 没有获取到音频特征的歌曲无法进行情绪分类，记为待重试，下次运行时再尝试
+    missing_feature_ids = {song_item['track']['id'] for song_item in songs
+                           if song_item['track']['id'] and song_item['track']['id'] not in audio_features}
+
+    # 先完成所有分类，把每个歌单需要添加的歌曲收集起来，最后再批量写入
+    print("Classifying songs based on language and emotion...")
+    pending_uris, playlist_names, track_ids_by_uri = classify_songs(songs, audio_features, config, existing_song_ids)
+
+    print("Adding songs to the respective playlists...")
+    added, new_snapshot_ids = add_items_to_playlists(sp, pending_uris, playlist_names)
+    snapshot_ids.update(new_snapshot_ids)
+    failed_song_ids = set()
+    for playlist_id, uris in pending_uris.items():
+        print(f"Added {len(added[playlist_id])}/{len(uris)} songs to {playlist_names[playlist_id]} Playlist.")
+        # 没有添加成功的歌曲不记录到同步状态中
+        for uri in set(uris) - set(added[playlist_id]):
+            existing_song_ids[playlist_id].discard(track_ids_by_uri[uri])
+            failed_song_ids.add(track_ids_by_uri[uri])
+
+    # 用于每个歌单
+    remove_duplicates_from_playlist(sp, config['playlist_a'], existing_song_ids)
+    for playlist_id in config['languages'].values():
+        remove_duplicates_from_playlist(sp, playlist_id, existing_song_ids)
+
+    print("All songs have been classified and added to the respective playlists.")
+
+    # 保存同步状态。添加失败或缺少音频特征的歌曲单独记为待重试，源歌单仍然记录真实的 snapshot_id，
+    # 这样这些歌曲不会导致每次运行都重新下载整个源歌单
+    retry_song_ids = failed_song_ids | missing_feature_ids
+    retry_tracks = {song_item['track']['id']: song_item['track'] for song_item in songs if song_item['track']['id'] in retry_song_ids}
+    sync_state.put_pending(config['playlist_a'], list(retry_tracks.values()))
+    for playlist_id, snapshot_id in snapshot_ids.items():
+        sync_state.put(playlist_id, snapshot_id, existing_song_ids[playlist_id])
+    sync_state.close()
+
+def load_config(config_path):
+    with open(config_path, 'r', encoding="utf8") as f:
+        return yaml.safe_load(f)
+
+def create_client(config):
+    # 使用不带重试适配器的 requests.Session，spotipy 才会抛出带有真实状态码和 Retry-After 头的异常，
+    # 由 RateLimitedClient 统一处理限速和重试
+    return RateLimitedClient(spotipy.Spotify(auth_manager=SpotifyOAuth(client_id=config['client_id'],
+                                                                       client_secret=config['client_secret'],
+                                                                       redirect_uri=config['redirect_uri'],
+                                                                       scope='playlist-modify-public'),
+                                             requests_session=requests.Session()),
+                             rate=config.get('requests_per_second', 10))
+
+if __name__ == "__main__":
+    # 定义命令行参数
+    parser = argparse.ArgumentParser(description='Manage Spotify playlists.')
+    parser.add_argument('--playlist-a', help='Name of Playlist A')
+    parser.add_argument('--filter', help='Filter condition for language')
+    parser.add_argument('--full', action='store_true', help='Ignore the saved sync state and classify every song again')
+    args = parser.parse_args()
+
+    # 读取配置文件
+    print("Reading configuration file...")
+    config = load_config(resolve_path(os.path.join('config', 'spotify_playlist_manager_config.yaml')))
+
+    print("Setting up configurations...")
+    if args.playlist_a:
+        config['playlist_a'] = args.playlist_a
+    if args.filter:
+        config['filter'] = args.filter
+
+    print("Connecting to Spotify...")
+    sp = create_client(config)
+
+    manage_playlists(sp, config, args.full)
+
+    print(f"API calls: {sp.stats['calls']}, rate limited: {sp.stats['rate_limited']}, "
+          f"retries: {sp.stats['retries']}, time spent waiting: {sp.stats['wait_time']:.1f}s")
+    print("\nTask Completed!")
@@ -0,0 +1,186 @@
+"""
+spotify_playlist_manager_benchmark.py
+
+这个脚本用一个模拟的 Spotify 客户端（FakeSpotify）在本地运行 spotify_playlist_manager.py 的同步逻辑，
+不需要 Spotify 账号和网络。模拟客户端提供合成的歌单和音频特征，可以配置每次调用的延迟、服务端的速率上限和随机 429 错误。
+
+对每种歌单大小，脚本会运行两次同步：
+- cold：本地没有同步状态和音频特征缓存，需要读取并分类所有歌曲。
+- incremental：源歌单新增 1% 的歌曲后再次同步，只需要处理新增的歌曲。
+
+每次运行都会输出 API 调用次数、耗时、429 次数和限速等待的总时间。
+
+用法：
+    python spotify_playlist_manager_benchmark.py [--sizes 1000 10000 50000] [--latency 0.02] [--rate 50]
+                                                 [--server-rate N] [--error-rate 0.01] [--retry-after 1]
+
+参数：
+- sizes：源歌单的歌曲数量，可以指定多个。
+- latency：模拟客户端每次调用的延迟（秒）。
+- rate：RateLimitedClient 的速率上限（每秒请求数）。
+- server-rate：模拟服务端每秒允许的请求数，超过时返回 429。默认不限制。
+- error-rate：每次调用随机返回 429 的概率。
+- retry-after：模拟服务端返回 429 时 Retry-After 头的值（秒）。
+"""
+
+import os
+import io
+import argparse
+import random
+import tempfile
+import threading
+import time
+import collections
+import contextlib
+import spotipy
+from spotify_playlist_manager import RateLimitedClient, manage_playlists
+
+LANGUAGES = {'中文': 'lang-zh', '非中文': 'lang-other'}
+EMOTIONS = {
+    '快乐': 'emotion-happy',
+    '悲伤': 'emotion-sad',
+    '宁静/放松': 'emotion-calm',
+    '愤怒/激烈': 'emotion-intense',
+    '浪漫/甜蜜': 'emotion-romantic',
+    '中性': 'emotion-neutral',
+}
+
+
+class FakeSpotify:
+    """提供 spotify_playlist_manager 用到的 spotipy.Spotify 方法，数据全部保存在内存中。"""
+
+    def __init__(self, playlists, features, latency=0.0, server_rate=None, error_rate=0.0, retry_after=1, seed=0):
+        self.playlists = playlists
+        self.features = features
+        self.snapshots = {playlist_id: 1 for playlist_id in playlists}
+        self.latency = latency
+        self.server_rate = server_rate
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.recent_calls = collections.deque()
+        self.calls = collections.Counter()
+
+    def _request(self, name):
+        with self.lock:
+            self.calls[name] += 1
+            now = time.monotonic()
+            # 模拟服务端按 1 秒滑动窗口限速
+            while self.recent_calls and now - self.recent_calls[0] >= 1:
+                self.recent_calls.popleft()
+            rate_limited = (self.server_rate is not None and len(self.recent_calls) >= self.server_rate) \
+                or self.random.random() < self.error_rate
+            if not rate_limited:
+                self.recent_calls.append(now)
+        if self.latency:
+            time.sleep(self.latency)
+        if rate_limited:
+            self.calls['429'] += 1
+            raise spotipy.SpotifyException(429, -1, 'API rate limit exceeded',
+                                           headers={'Retry-After': str(self.retry_after)})
+
+    def _snapshot_id(self, playlist_id):
+        return f"{playlist_id}-{self.snapshots[playlist_id]}"
+
+    def playlist(self, playlist_id, fields=None):
+        self._request('playlist')
+        return {'snapshot_id': self._snapshot_id(playlist_id)}
+
+    def playlist_items(self, playlist_id, fields=None, limit=100, offset=0, additional_types=('track',)):
+        self._request('playlist_items')
+        tracks = self.playlists[playlist_id]
+        return {'total': len(tracks), 'items': [{'track': track} for track in tracks[offset:offset + limit]]}
+
+    def audio_features(self, tracks):
+        self._request('audio_features')
+        return [self.features.get(track_id) for track_id in tracks]
+
+    def playlist_add_items(self, playlist_id, items, position=None):
+        self._request('playlist_add_items')
+        with self.lock:
+            self.playlists[playlist_id].extend({'id': uri.rsplit(':', 1)[-1], 'uri': uri, 'name': ''} for uri in items)
+            self.snapshots[playlist_id] += 1
+            return {'snapshot_id': self._snapshot_id(playlist_id)}
+
+    def playlist_remove_all_occurrences_of_items(self, playlist_id, items, snapshot_id=None):
+        self._request('playlist_remove_all_occurrences_of_items')
+        with self.lock:
+            self.playlists[playlist_id] = [track for track in self.playlists[playlist_id] if track['id'] not in items]
+            self.snapshots[playlist_id] += 1
+            return {'snapshot_id': self._snapshot_id(playlist_id)}
+
+    def add_source_tracks(self, playlist_id, count, rng):
+        start = len(self.playlists[playlist_id])
+        for i in range(start, start + count):
+            track = make_track(i)
+            self.playlists[playlist_id].append(track)
+            self.features[track['id']] = make_features(rng)
+        self.snapshots[playlist_id] += 1
+
+
+def make_track(i):
+    track_id = f"track{i:07d}"
+    # 每三首歌中有一首使用中文名称
+    name = f"歌曲 {i}" if i % 3 == 0 else f"Song {i}"
+    return {'id': track_id, 'uri': f"spotify:track:{track_id}", 'name': name}
+
+
+def make_features(rng):
+    return {'energy': rng.random(), 'danceability': rng.random(), 'mode': rng.randint(0, 1)}
+
+
+def build_fake_client(size, rng, **kwargs):
+    source = [make_track(i) for i in range(size)]
+    features = {track['id']: make_features(rng) for track in source}
+    playlists = {'source': source}
+    for playlist_id in list(LANGUAGES.values()) + list(EMOTIONS.values()):
+        # 目标歌单中预先放入一部分源歌曲，模拟已经同步过的歌曲
+        playlists[playlist_id] = [dict(track) for track in rng.sample(source, size // 20)]
+    return FakeSpotify(playlists, features, **kwargs)
+
+
+def run_once(fake, config, rate):
+    sp = RateLimitedClient(fake, rate=rate, backoff=0.1)
+    calls_before = sum(count for name, count in fake.calls.items() if name != '429')
+    start = time.perf_counter()
+    # 同步过程会逐首打印歌曲信息，测量时丢弃这些输出
+    with contextlib.redirect_stdout(io.StringIO()):
+        manage_playlists(sp, config)
+    elapsed = time.perf_counter() - start
+    calls = sum(count for name, count in fake.calls.items() if name != '429') - calls_before
+    return calls, elapsed, sp.stats
+
+
+def benchmark(sizes, latency, rate, server_rate, error_rate, retry_after):
+    print(f"{'tracks':>8} {'run':<12} {'API calls':>10} {'wall time':>10} {'429s':>6} {'waiting':>9}")
+    for size in sizes:
+        rng = random.Random(size)
+        fake = build_fake_client(size, rng, latency=latency, server_rate=server_rate,
+                                 error_rate=error_rate, retry_after=retry_after, seed=size)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            config = {
+                'playlist_a': 'source',
+                'languages': LANGUAGES,
+                'emotions': EMOTIONS,
+                'state_path': os.path.join(temp_dir, 'state.sqlite'),
+                'feature_cache_path': os.path.join(temp_dir, 'features.sqlite'),
+            }
+            for run in ('cold', 'incremental'):
+                if run == 'incremental':
+                    fake.add_source_tracks('source', max(size // 100, 1), rng)
+                calls, elapsed, stats = run_once(fake, config, rate)
+                print(f"{size:>8} {run:<12} {calls:>10} {elapsed:>9.2f}s {stats['rate_limited']:>6} {stats['wait_time']:>8.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark spotify_playlist_manager against a fake Spotify client.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000], help='Number of tracks in the source playlist.')
+    parser.add_argument('--latency', type=float, default=0.02, help='Latency of every fake API call in seconds.')
+    parser.add_argument('--rate', type=float, default=50, help='Request rate limit of the client in requests per second.')
+    parser.add_argument('--server-rate', type=int, help='Requests per second the fake server accepts before returning 429.')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Probability that a fake API call returns 429.')
+    parser.add_argument('--retry-after', type=int, default=1, help='Retry-After value of injected 429 responses in seconds.')
+    args = parser.parse_args()
+
+    benchmark(args.sizes, args.latency, args.rate, args.server_rate, args.error_rate, args.retry_after)